@@ -0,0 +1,77 @@
+from __future__ import annotations
+import threading
+import time
+from typing import List, Tuple, Optional
+
+Token = Tuple[str, str]  # (token_type, lexeme)
+
+# The lexer and parser only look at the clock and the cancellation flag
+# once every this many tokens / statements
+CHECK_INTERVAL = 1024
+
+class BudgetExceeded(Exception):
+    # tokens holds whatever was tokenized before the analysis stopped
+    def __init__(self, message: str, tokens: Optional[List[Token]] = None, line: Optional[int] = None):
+        super().__init__(f'Line {line}: {message}' if line is not None else message)
+        self.message = message
+        self.tokens: List[Token] = tokens or []
+        self.line = line
+
+# Shared between the caller and a running analysis; cancel() may be called from another thread.
+# Passing a multiprocessing Event lets worker processes see the cancellation too.
+class CancellationToken:
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+# Limits for one analysis run; None means unlimited.
+# The wall-clock deadline starts counting when the budget is created.
+class AnalysisBudget:
+    def __init__(
+            self,
+            max_source_bytes: Optional[int] = None,
+            max_tokens: Optional[int] = None,
+            max_nesting: Optional[int] = None,
+            deadline_seconds: Optional[float] = None,
+            cancel_token: Optional[CancellationToken] = None,
+        ):
+        self.max_source_bytes = max_source_bytes
+        self.max_tokens = max_tokens
+        self.max_nesting = max_nesting
+        self.deadline: Optional[float] = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        self.cancel_token = cancel_token
+
+    # Seconds left before the deadline (None if there is no deadline)
+    def remaining_seconds(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check_source(self, text: str) -> None:
+        if self.max_source_bytes is None:
+            return
+        size = len(text) if text.isascii() else len(text.encode('utf-8'))
+        if size > self.max_source_bytes:
+            raise BudgetExceeded(f'Source is {size} bytes, limit is {self.max_source_bytes}')
+
+    def check_tokens(self, count: int, tokens: Optional[List[Token]] = None) -> None:
+        if self.max_tokens is not None and count > self.max_tokens:
+            partial = tokens[:self.max_tokens] if tokens is not None else None
+            raise BudgetExceeded(f'More than {self.max_tokens} tokens', tokens=partial)
+
+    def check_nesting(self, depth: int, line: Optional[int] = None) -> None:
+        if self.max_nesting is not None and depth > self.max_nesting:
+            raise BudgetExceeded(f'Nesting deeper than {self.max_nesting}', line=line)
+
+    # The periodic check: cancellation and the deadline
+    def check_time(self, tokens: Optional[List[Token]] = None, line: Optional[int] = None) -> None:
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise BudgetExceeded('Analysis cancelled', tokens=tokens, line=line)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded('Analysis took too long', tokens=tokens, line=line)
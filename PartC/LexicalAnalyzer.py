@@ -1,10 +1,37 @@
+import codecs
 import re
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from AnalysisBudget import AnalysisBudget, CHECK_INTERVAL
 
 Token = Tuple[str, str]
 TokenRow = Tuple[str, str, str]
 
+# Large files are decoded and lexed this many bytes at a time (see split_source)
+SOURCE_CHUNK_BYTES = 256 * 1024
+
+# ---Chunked reading---
+# Yields (text, end offset in bytes) for consecutive pieces of `data` (bytes or an mmap).
+# Each piece ends just after a newline so no token is split between pieces; a line
+# longer than chunk_bytes comes out whole, up to its own newline. Pieces are decoded
+# as UTF-8 without a leading byte order mark, and '\r\n' line endings become '\n',
+# so lexing the pieces one by one gives the same tokens as lexing the whole file.
+def split_source(data, chunk_bytes: int = SOURCE_CHUNK_BYTES) -> Iterator[Tuple[str, int]]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    size = len(data)
+    start = 0
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        if end < size:
+            newline = data.rfind(b'\n', start, end)
+            if newline < start:
+                newline = data.find(b'\n', end)
+            end = newline + 1 if newline >= 0 else size
+        text = decoder.decode(data[start:end], final=(end == size))
+        yield text.replace('\r\n', '\n'), end
+        start = end
+
 class LexicalAnalyzer:
     def __init__(
             self,
@@ -79,10 +106,17 @@ class LexicalAnalyzer:
         group = [f'(?P<{n}>{p})' for n, p in token_specifications]
         return re.compile('|'.join(group))
 
-    def tokenize(self, text: str) -> Tuple[List[Token], List[str]]:
+    # With a budget, raises BudgetExceeded (carrying the tokens found so far) when the
+    # source, token count, deadline or cancellation limit is hit
+    def tokenize(self, text: str, budget: Optional[AnalysisBudget] = None) -> Tuple[List[Token], List[str]]:
         tokens: List[Token] = []
         errors: List[str] = []
-        for match in self.master_re.finditer(text):
+        if budget is not None:
+            budget.check_source(text)
+        for count, match in enumerate(self.master_re.finditer(text), 1):
+            if budget is not None and count % CHECK_INTERVAL == 0:
+                budget.check_tokens(len(tokens), tokens)
+                budget.check_time(tokens)
             token_type = match.lastgroup
             lexeme = match.group()
 
@@ -91,7 +125,7 @@ class LexicalAnalyzer:
                     tokens.append(('NEWLINE', '\\n'))
                 continue  # ignored SKIP (whitespace) tokens; only preserve NEWLINE
 
-            if token_type in ('BADSEQ', 'MISMATCH'):
+            if token_type in ('BADSEQ', 'BADSTRING', 'MISMATCH'):
                 errors.append(f'Error, {lexeme!r} is not a valid token')
                 continue
 
@@ -100,6 +134,8 @@ class LexicalAnalyzer:
 
             tokens.append((token_type, lexeme))
 
+        if budget is not None:
+            budget.check_tokens(len(tokens), tokens)
         return  tokens, errors
 
     def describe_token(self, kind: str) -> Tuple[str, str]:
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Optional
+
+# (line, index of the token among the tokens on that line) -- a token count, not a character column
+Location = Tuple[int, int]
+
+class SymbolIndex:
+    def __init__(self):
+        # name -> locations, kept in source order because the parser records them in one linear pass
+        self.definitions: Dict[str, List[Location]] = {}
+        self.uses: Dict[str, List[Location]] = {}
+        # name -> uses that appear before the name is first assigned
+        self.early_uses: Dict[str, List[Location]] = {}
+
+    # ---Recording (called by SyntaxAnalyzer while parsing)---
+    # The parser records a definition only after the whole statement is read,
+    # so in 'x = x + 1' the use of x is seen before x is defined.
+    def add_definition(self, name: str, location: Location) -> None:
+        self.definitions.setdefault(name, []).append(location)
+
+    def add_use(self, name: str, location: Location) -> None:
+        self.uses.setdefault(name, []).append(location)
+        if name not in self.definitions:
+            self.early_uses.setdefault(name, []).append(location)
+
+    # ---Lookup---
+    def definition_of(self, name: str) -> Optional[Location]:
+        locations = self.definitions.get(name)
+        return locations[0] if locations else None
+
+    def uses_of(self, name: str) -> List[Location]:
+        return self.uses.get(name, [])
+
+    def used_before_assigned(self, name: str) -> List[Location]:
+        return self.early_uses.get(name, [])
+
+    def names(self) -> List[str]:
+        return sorted(set(self.definitions) | set(self.uses))
+
+    # "used before assigned" messages in source order
+    def diagnostics(self) -> List[str]:
+        found: List[Tuple[Location, str]] = []
+        for name, locations in self.early_uses.items():
+            for location in locations:
+                found.append((location, name))
+        found.sort()
+        return [f'Line {line}: {name!r} is used before it is assigned' for (line, _), name in found]
+
+    # ---Incremental update---
+    # Replaces everything recorded on lines first_line..last_line with `patch`,
+    # an index built by parsing only the edited lines (so its lines start at 1).
+    # line_delta is how many lines the edit added (negative if lines were removed);
+    # locations after the edit are shifted instead of being parsed again.
+    # The patch has to parse on its own, so first_line..last_line must cover whole
+    # top-level statements: an edit inside a for/if body means re-parsing the entire
+    # enclosing block (split_top_level in SyntaxAnalyzer finds those boundaries).
+    def replace_lines(self, first_line: int, last_line: int, patch: SymbolIndex, line_delta: int) -> None:
+        touched = set(patch.definitions) | set(patch.uses)
+
+        for table in (self.definitions, self.uses):
+            for name in list(table):
+                old = table[name]
+                if not old or (old[-1][0] < first_line):
+                    continue  # nothing at or after the edit
+                kept = [s for s in old if s[0] < first_line]
+                kept += [(line + line_delta, pos) for line, pos in old if line > last_line]
+                if kept:
+                    table[name] = kept
+                else:
+                    del table[name]
+                touched.add(name)
+
+        self.merge(patch, line_offset=first_line - 1, names=touched)
+
+    # Adds the locations of another index whose lines start at line_offset + 1
+    # (an edited region or a separately parsed chunk of the same file)
+    def merge(self, other: SymbolIndex, line_offset: int = 0, names: Optional[set] = None) -> None:
+        for source, table in ((other.definitions, self.definitions), (other.uses, self.uses)):
+            for name, locations in source.items():
+                shifted = [(line + line_offset, pos) for line, pos in locations]
+                existing = table.setdefault(name, [])
+                # chunks merged in source order only need appending
+                if existing and shifted and existing[-1] > shifted[0]:
+                    existing.extend(shifted)
+                    existing.sort()
+                else:
+                    existing.extend(shifted)
+
+        # only names that appear in either index can change their "used before assigned" status
+        for name in (names or set()) | set(other.definitions) | set(other.uses):
+            self._recompute_early_uses(name)
+
+    def _recompute_early_uses(self, name: str) -> None:
+        # a use is early unless the name was assigned on an earlier line;
+        # a definition on the same line is the statement that contains the use
+        first = self.definition_of(name)
+        early = [s for s in self.uses_of(name) if first is None or s[0] <= first[0]]
+        if early:
+            self.early_uses[name] = early
+        else:
+            self.early_uses.pop(name, None)
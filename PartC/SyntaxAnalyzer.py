@@ -1,21 +1,55 @@
 from __future__ import annotations
-from typing import List, Tuple, Dict, Iterable, Optional
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from types import MappingProxyType
+from typing import List, Tuple, Dict, Iterable, Optional, Mapping
 from pathlib import Path
 
+from SymbolIndex import SymbolIndex, Location
+from AnalysisBudget import AnalysisBudget, BudgetExceeded, CancellationToken, CHECK_INTERVAL
+
 Token = Tuple[str, str]  # (token_type, lexeme)
 
+# Deepest nesting of blocks and expressions the parser accepts, budget or not.
+# Each level costs up to 7 Python stack frames, so this stays well inside the
+# default recursion limit of 1000 (also in worker threads and processes).
+MAX_NESTING = 100
+
 class ParseError(Exception):
     def __init__(self, message: str, line: int):
         super().__init__(f'Line {line}: {message}')
+        self.message = message
         self.line = line
+        # what was indexed before the error; filled in by SerpentParser.parse
+        self.symbols: Optional[SymbolIndex] = None
 
+# Holds the state of one parse (token list, cursor, symbols), so it is used once and
+# thrown away. To parse many documents, use SerpentParser, which loads the
+# configuration once and creates a SyntaxAnalyzer per call.
 class SyntaxAnalyzer:
-    def __init__(self, tokens: List[Token], block_termination_path: str = 'block_termination.txt'):
+    def __init__(self, tokens: List[Token], block_termination_path: str = 'block_termination.txt',
+                 budget: Optional[AnalysisBudget] = None, block_endings: Optional[Mapping[str, str]] = None):
         # keep the NEWLINE
         # enforce ':' NEWLINE after headers
         self.tokens: List[Token] = tokens
         self.i: int = 0
-        self.block_endings: Dict[str, str] = self._load_block_terminators(Path(block_termination_path))
+        # current line and the index of its first token, tracked as NEWLINEs are consumed
+        self.line: int = 1
+        self.line_start: int = 0
+        self.symbols: SymbolIndex = SymbolIndex()
+        # optional limits: nesting is checked on every nested block/expression, the clock every
+        # CHECK_INTERVAL steps (statements, nested expressions and binary operators)
+        self.budget: Optional[AnalysisBudget] = budget
+        self.depth: int = 0
+        self.steps: int = 0
+        # block_endings that are already loaded (e.g. by SerpentParser) skip reading the file
+        if block_endings is None:
+            block_endings = self._load_block_terminators(Path(block_termination_path))
+        self.block_endings: Mapping[str, str] = block_endings
 
     # ---Configuration---
     @staticmethod
@@ -50,9 +84,16 @@ class SyntaxAnalyzer:
     def _accept(self, token_type: str) -> bool:
         if self._peek()[0] == token_type:
             self.i += 1
+            if token_type == 'NEWLINE':
+                self.line += 1
+                self.line_start = self.i
             return True
         return False
 
+    # (line, index among the tokens on that line) of the token at self.i + n
+    def _location(self, n: int = 0) -> Location:
+        return self.line, self.i + n - self.line_start
+
     def _expect(self, token_type: str) -> Token:
         if self._accept(token_type):
             return self.tokens[self.i - 1]
@@ -72,6 +113,23 @@ class SyntaxAnalyzer:
             got_token, got_value = self._peek()
             self._err(f'Expected {keyword!r}, got {got_value or got_token!r}')
 
+    # ---Budget helpers---
+    def _tick(self) -> None:
+        self.steps += 1
+        if self.budget is not None and self.steps % CHECK_INTERVAL == 0:
+            self.budget.check_time(line=self.line)
+
+    def _enter(self) -> None:
+        self._tick()
+        self.depth += 1
+        if self.budget is not None:
+            self.budget.check_nesting(self.depth, line=self.line)
+        if self.depth > MAX_NESTING:
+            self._err(f'Nesting deeper than {MAX_NESTING} levels')
+
+    def _leave(self) -> None:
+        self.depth -= 1
+
     # ---Skips over NEWLINE tokens---
     def _skip_newlines(self) -> None:
         while self._accept('NEWLINE'):
@@ -91,6 +149,7 @@ class SyntaxAnalyzer:
                 return
             if token is None:
                 return
+            self._tick()
             self.parse_stmt()
             self._expect_stmt_terminator(allow_end_keywords=ends)
 
@@ -102,8 +161,11 @@ class SyntaxAnalyzer:
 
     # Program ::= StatementList
     def parse_program(self) -> bool:
+        if self.budget is not None:
+            self.budget.check_tokens(len(self.tokens))
         self._skip_newlines()
         while self._peek()[0] is not None:
+            self._tick()
             self.parse_stmt()
             self._expect_stmt_terminator()
         return True
@@ -145,9 +207,17 @@ class SyntaxAnalyzer:
 
     # Assignment ::= Identifier "=" Expression
     def parse_assign(self) -> None:
-        self._expect('IDENT')
-        if self._accept('ASSIGN') or self._accept('AUGASSIGN'):
+        location = self._location()
+        _, name = self._expect('IDENT')
+        if self._accept('ASSIGN'):
+            self.parse_expr()
+            self.symbols.add_definition(name, location)
+            return
+        if self._accept('AUGASSIGN'):
+            # 'x += 1' reads x before writing it
+            self.symbols.add_use(name, location)
             self.parse_expr()
+            self.symbols.add_definition(name, location)
             return
         token, value = self._peek()
         self._err(f'Unexpected ASSIGN or AUGASSIGN, got {value or token!r}')
@@ -169,8 +239,10 @@ class SyntaxAnalyzer:
     #                      StatementList
     #                      "endfor"
     def parse_for_block(self) -> None:
+        self._enter()
         self._expect_keyword('for')
-        self._expect('IDENT')
+        location = self._location()
+        _, name = self._expect('IDENT')
 
         # 'in'
         if not (self._peek()[0] == 'KEYWORD' and self._peek()[1] == 'in'):
@@ -178,6 +250,7 @@ class SyntaxAnalyzer:
         self.i += 1  # eats 'in'
 
         self.parse_expr()
+        self.symbols.add_definition(name, location)
         self._expect('COLON')
         self._expect('NEWLINE')
         self._skip_newlines()
@@ -186,6 +259,7 @@ class SyntaxAnalyzer:
 
         self._parse_statement_list_until(end_keywords=(end_for,))
         self._expect_keyword(end_for)
+        self._leave()
 
     # IfStatement      ::= "if" Expression ":" NEWLINE
     #                      StatementList
@@ -193,6 +267,7 @@ class SyntaxAnalyzer:
     #                        StatementList ]
     #                      "endif"
     def parse_if_block(self) -> None:
+        self._enter()
         self._expect_keyword('if')
         self.parse_expr()
         self._expect('COLON')
@@ -213,6 +288,7 @@ class SyntaxAnalyzer:
             self._parse_statement_list_until(end_keywords=(end_if,))
 
         self._expect_keyword(end_if)
+        self._leave()
 
     # ListLiteral      ::= "[" [ Number { "," Number } ] "]"
     def parse_list_literal(self) -> None:
@@ -233,37 +309,42 @@ class SyntaxAnalyzer:
     def parse_expr(self) -> None:
         self.parse_conditional()
 
+    # every nested expression (parentheses, list items, call arguments, else-branches)
+    # passes through here, so this is where expression nesting is counted
     def parse_conditional(self) -> None:
+        self._enter()
         self.parse_comparison()
         if self._accept_keyword('if'):
             self.parse_comparison()
             self._expect_keyword('else')
             self.parse_conditional()
-            return
+        self._leave()
 
     def parse_comparison(self) -> None:
         self.parse_additive()
         while (self._accept('EQEQ') or self._accept('NEQ') or
                self._accept('LT') or self._accept('LE') or
                 self._accept('GT') or self._accept('GE')):
+            self._tick()
             self.parse_additive()
 
     def parse_additive(self) -> None:
         self.parse_term()
         while self._accept('PLUS') or self._accept('MINUS'):
+            self._tick()
             self.parse_term()
 
     def parse_term(self) -> None:
         self.parse_factor()
         while self._accept('STAR') or self._accept('SLASH'):
+            self._tick()
             self.parse_factor()
 
     def parse_factor(self) -> None:
-        if self._accept('PLUS'):
-            self.parse_factor()
-            return
-        if self._accept('MINUS'):
+        if self._accept('PLUS') or self._accept('MINUS'):
+            self._enter()
             self.parse_factor()
+            self._leave()
             return
 
         token, _ = self._peek()
@@ -272,6 +353,8 @@ class SyntaxAnalyzer:
                 return
 
         if token in ('NUMBER', 'STRING', 'IDENT'):
+            if token == 'IDENT':
+                self.symbols.add_use(self._peek()[1], self._location())
             self.i += 1
             return
 
@@ -290,6 +373,8 @@ class SyntaxAnalyzer:
         if self._peek()[0] not in ('IDENT', 'BUILTIN'):
             got, val = self._peek()
             self._err(f'Unexpected function name, got {val or got!r}')
+        if self._peek()[0] == 'IDENT':
+            self.symbols.add_use(self._peek()[1], self._location())
         self.i += 1 # eats name
 
         self._expect('LPAREN')
@@ -300,7 +385,7 @@ class SyntaxAnalyzer:
         self._expect('RPAREN')
 
     def _line(self):
-        return 1 + sum(1 for k, _ in self.tokens[:self.i] if k == 'NEWLINE')
+        return self.line
 
     def _err(self, message: str) -> None:
         raise ParseError(message, self._line())
@@ -317,3 +402,220 @@ class SyntaxAnalyzer:
 
         self._err(f'Expected NEWLINE {", ".join(allow_end_keywords)}, got {value!r}')
 
+
+
+# ---Parallel parsing---
+# Top-level statements do not depend on each other syntactically, so a large program
+# can be cut at NEWLINEs that are outside every for/if block and the pieces parsed
+# in separate processes.
+
+# Below this many tokens the cost of starting processes outweighs the gain
+PARALLEL_MIN_TOKENS = 50_000
+# Pieces are cut at the first top-level statement boundary after this many tokens.
+# The size does not depend on the number of workers, so neither do the results.
+PARALLEL_CHUNK_TOKENS = 20_000
+# How often parse_parallel checks the caller's budget while workers are running
+PARALLEL_POLL_SECONDS = 0.05
+
+# Returns (start, end, first_line) for each piece of the token list.
+# A cheap pre-scan that only counts block openers ('for'/'if' at the start of a
+# statement, so 'a if c else b' does not count) and their terminators.
+def split_top_level(tokens: List[Token], block_endings: Mapping[str, str],
+                    target: int = PARALLEL_CHUNK_TOKENS,
+                    budget: Optional[AnalysisBudget] = None) -> List[Tuple[int, int, int]]:
+    openers = {'for', 'if'}
+    closers = {block_endings.get('for', 'endfor'), block_endings.get('if', 'endif')}
+    target = max(1, target)
+
+    chunks: List[Tuple[int, int, int]] = []
+    start, first_line = 0, 1
+    line, depth = 1, 0
+    at_statement_start = True
+    for i, (token, value) in enumerate(tokens):
+        if budget is not None and i % CHECK_INTERVAL == 0:
+            budget.check_time(line=line)
+        if token == 'NEWLINE':
+            line += 1
+            at_statement_start = True
+            next_token = tokens[i + 1][0] if i + 1 < len(tokens) else None
+            # cut after the last NEWLINE of a run, between two top-level statements
+            if depth == 0 and next_token != 'NEWLINE' and i + 1 - start >= target:
+                chunks.append((start, i + 1, first_line))
+                start, first_line = i + 1, line
+            continue
+        if token == 'KEYWORD':
+            if at_statement_start and value in openers:
+                depth += 1
+            elif value in closers:
+                depth = max(0, depth - 1)
+        at_statement_start = False
+
+    if start < len(tokens):
+        chunks.append((start, len(tokens), first_line))
+    return chunks
+
+# Parses one piece. Returns (error, symbols) where error is None or
+# (kind, message, line within the piece) and kind is 'parse' or 'budget'.
+PieceResult = Tuple[Optional[Tuple[str, str, Optional[int]]], SymbolIndex]
+
+def _parse_piece(tokens: List[Token], block_endings: Mapping[str, str],
+                 budget: Optional[AnalysisBudget] = None) -> PieceResult:
+    syn = SyntaxAnalyzer(tokens, budget=budget, block_endings=block_endings)
+    try:
+        syn.parse_program()
+        return None, syn.symbols
+    except ParseError as e:
+        return ('parse', e.message, e.line), syn.symbols
+    except BudgetExceeded as e:
+        return ('budget', e.message, e.line), syn.symbols
+
+# Per-process state of a parse_parallel worker, set once by _init_worker.
+# With the 'fork' start method the whole token list reaches the workers through the
+# forked memory, so only (start, end) offsets are sent per piece instead of pickled tokens;
+# with any other start method each piece is sent with its tokens.
+# The caller's limits arrive as plain values: the deadline as wall-clock time (the
+# monotonic clock is not comparable between processes) and cancellation as a shared Event.
+_worker_tokens: Optional[List[Token]] = None
+_worker_block_endings: Dict[str, str] = {}
+_worker_max_nesting: Optional[int] = None
+_worker_deadline: Optional[float] = None
+_worker_cancel: Optional[CancellationToken] = None
+
+def _init_worker(tokens: Optional[List[Token]], block_endings: Dict[str, str], max_nesting: Optional[int],
+                 deadline: Optional[float], cancel_event) -> None:
+    global _worker_tokens, _worker_block_endings, _worker_max_nesting, _worker_deadline, _worker_cancel
+    _worker_tokens = tokens
+    _worker_block_endings = block_endings
+    _worker_max_nesting = max_nesting
+    _worker_deadline = deadline
+    _worker_cancel = CancellationToken(cancel_event)
+
+# job is (start, end, tokens): tokens is None when the worker already holds the full list
+def _parse_chunk(job: Tuple[int, int, Optional[List[Token]]]) -> PieceResult:
+    start, end, tokens = job
+    if tokens is None:
+        tokens = _worker_tokens[start:end]
+    remaining = _worker_deadline - time.time() if _worker_deadline is not None else None
+    budget = AnalysisBudget(max_nesting=_worker_max_nesting, deadline_seconds=remaining, cancel_token=_worker_cancel)
+    return _parse_piece(tokens, _worker_block_endings, budget)
+
+# 'fork' is only used on Linux and only while no other thread is running: forking a
+# multi-threaded process can deadlock the child (Python 3.12 warns about it), and macOS
+# does not support it reliably. Otherwise the platform's default start method is used.
+def _fork_context():
+    if sys.platform.startswith('linux') and threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    return None
+
+
+# ---Reusable parser---
+# Reads block_termination.txt once; the configuration cannot be changed afterwards.
+# Every parse() call gets its own SyntaxAnalyzer for the cursor and symbols, so one
+# SerpentParser can be shared by any number of threads without locking.
+class SerpentParser:
+    __slots__ = ('_block_endings',)
+
+    def __init__(self, block_termination_path: str = 'block_termination.txt'):
+        endings = SyntaxAnalyzer._load_block_terminators(Path(block_termination_path))
+        self._block_endings: Mapping[str, str] = MappingProxyType(dict(endings))
+
+    @property
+    def block_endings(self) -> Mapping[str, str]:
+        return self._block_endings
+
+    # Returns the symbols on success. Raises ParseError on the first syntax error,
+    # with the symbols indexed up to that point in its .symbols
+    def parse(self, tokens: List[Token], budget: Optional[AnalysisBudget] = None) -> SymbolIndex:
+        syn = SyntaxAnalyzer(tokens, budget=budget, block_endings=self._block_endings)
+        try:
+            syn.parse_program()
+        except ParseError as e:
+            e.symbols = syn.symbols
+            raise
+        return syn.symbols
+
+    # Parses the whole token list using up to `workers` processes (default: all cores).
+    # Unlike parse(), which stops at the first error, this reports the first
+    # error of every piece of about chunk_tokens tokens, with line numbers relative
+    # to the whole program. The result is the same for any number of workers.
+    def parse_parallel(
+            self,
+            tokens: List[Token],
+            workers: Optional[int] = None,
+            budget: Optional[AnalysisBudget] = None,
+            chunk_tokens: int = PARALLEL_CHUNK_TOKENS,
+        ) -> Tuple[List[ParseError], SymbolIndex]:
+        if budget is not None:
+            budget.check_tokens(len(tokens))
+            budget.check_time()
+        workers = workers or os.cpu_count() or 1
+        chunks = split_top_level(tokens, self._block_endings, chunk_tokens, budget)
+
+        results: List[Optional[PieceResult]] = [None] * len(chunks)
+        if workers == 1 or len(chunks) == 1 or len(tokens) < PARALLEL_MIN_TOKENS:
+            for index, (start, end, _) in enumerate(chunks):
+                results[index] = _parse_piece(tokens[start:end], self._block_endings, budget)
+                self._raise_if_over_budget(chunks[index], results[index])
+        else:
+            # a plain dict, because a mappingproxy cannot be sent to another process
+            block_endings = dict(self._block_endings)
+            context = _fork_context()
+            if context is not None:
+                # forked workers inherit the token list; initargs are not pickled with 'fork'
+                jobs = [(start, end, None) for start, end, _ in chunks]
+                shared = tokens
+            else:
+                # other start methods pickle initargs once per worker, so send each piece instead
+                jobs = [(start, end, tokens[start:end]) for start, end, _ in chunks]
+                shared = None
+
+            max_nesting = budget.max_nesting if budget is not None else None
+            remaining = budget.remaining_seconds() if budget is not None else None
+            deadline = time.time() + remaining if remaining is not None else None
+            cancel_event = (context or multiprocessing).Event()
+
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                       initargs=(shared, block_endings, max_nesting, deadline, cancel_event))
+            try:
+                pending = {pool.submit(_parse_chunk, job): index for index, job in enumerate(jobs)}
+                while pending:
+                    done, _ = wait(pending, timeout=PARALLEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = pending.pop(future)
+                        results[index] = future.result()
+                        self._raise_if_over_budget(chunks[index], results[index])
+                    if budget is not None:
+                        budget.check_time()
+            except BaseException:
+                # stop the running pieces at their next budget check and drop the queued ones
+                cancel_event.set()
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+            pool.shutdown(wait=True)
+
+        errors: List[ParseError] = []
+        symbols = SymbolIndex()
+        for (_, _, first_line), (error, chunk_symbols) in zip(chunks, results):
+            if error is not None:
+                _, message, line = error
+                errors.append(ParseError(message, first_line + line - 1))
+            symbols.merge(chunk_symbols, line_offset=first_line - 1)
+        return errors, symbols
+
+    @staticmethod
+    def _raise_if_over_budget(chunk: Tuple[int, int, int], result: PieceResult) -> None:
+        error = result[0]
+        if error is not None and error[0] == 'budget':
+            _, message, line = error
+            first_line = chunk[2]
+            raise BudgetExceeded(message, line=first_line + line - 1 if line is not None else None)
+
+def parse_program_parallel(
+        tokens: List[Token],
+        block_termination_path: str = 'block_termination.txt',
+        workers: Optional[int] = None,
+        budget: Optional[AnalysisBudget] = None,
+        chunk_tokens: int = PARALLEL_CHUNK_TOKENS,
+    ) -> Tuple[List[ParseError], SymbolIndex]:
+    return SerpentParser(block_termination_path).parse_parallel(tokens, workers=workers, budget=budget,
+                                                                chunk_tokens=chunk_tokens)
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import sys
+import time
+
+from typing import List, Tuple, Optional
+from pathlib import Path
+
+from LexicalAnalyzer import LexicalAnalyzer
+from SyntaxAnalyzer import SyntaxAnalyzer, SerpentParser, ParseError, MAX_NESTING
+from AnalysisBudget import AnalysisBudget, BudgetExceeded
+
+# Worst-case performance fuzzer for the lexer and parser.
+#
+# Each candidate is a short seed that is repeated until it fills `size` bytes, so a
+# seed that triggers superlinear work shows up as a high time per byte. Seeds are
+# scored in two modes:
+#   parser - the seed is repeated as whole lines and run through tokenize and
+#            parse_program; it only scores if the parse gets through most of the
+#            input or stops at the nesting limit / budget, so a parse that fails on
+#            the first line is not mistaken for a fast parser
+#   lexer  - the seed is repeated within the same line(s) and only tokenized, which
+#            finds patterns that get slower as a line gets longer
+# The slowest seeds are minimized and, if they grow superlinearly or nest deeply,
+# saved to fuzz_corpus/ with a time limit; `python fuzz_analysis.py check` replays
+# them without any budget, and tests/test_fuzz_corpus.py checks their growth.
+#
+#   python fuzz_analysis.py fuzz --iterations 2000 --save 5
+#   python fuzz_analysis.py check
+
+DEFAULT_SIZE = 4096
+# time(4 * size) / time(size) is about 4 for linear work; above this is superlinear
+MAX_GROWTH_RATIO = 8.0
+# saved limits are this many times the measured time, but never below MIN_LIMIT_SECONDS
+LIMIT_FACTOR = 20.0
+MIN_LIMIT_SECONDS = 0.05
+# a minimized seed is only saved if it grows faster than this, or nests this deep;
+# linear inputs of ordinary depth are covered by the parser tests already
+SAVE_MIN_GROWTH = 5.0
+SAVE_MIN_DEPTH = MAX_NESTING // 5
+# a parser-mode parse that fails before this fraction of the tokens is not scored
+MIN_PARSE_PROGRESS = 0.9
+# stops a single fuzz measurement that hangs; `check` runs without any budget
+FUZZ_DEADLINE_SECONDS = 10.0
+
+MODES = ('parser', 'lexer')
+
+CORPUS_INDEX = 'corpus.txt'
+
+# Operators and delimiters from token_lexeme.txt, plus fragments that stress the STRING
+# pattern and the \b around keyword alternations
+SYMBOLS = [
+    '=', '+=', '-=', '*=', '/=', '==', '!=', '<=', '>=', '<', '>',
+    '+', '-', '*', '/', '[', ']', '(', ')', ':', ',',
+]
+FRAGMENTS = ["'", '"', '\\', "\\'", 'f', "f'", '_', '0', '1.5', '.', ' ', '\t', '\n', '#', '!']
+
+# to make file-relative paths
+def _here() -> Path:
+    return Path(__file__).parent.resolve()
+
+class Measurement:
+    def __init__(self, seconds: float, depth: int, outcome: str, progress: float):
+        self.seconds = seconds
+        self.depth = depth
+        # 'ok', 'lex errors', 'parse error', 'nesting', 'budget', 'recursion'
+        self.outcome = outcome
+        self.progress = progress  # fraction of the tokens the parser consumed
+
+    # a parse that ran to the end, or was stopped by a limit, measured the parser
+    @property
+    def parsed_enough(self) -> bool:
+        return self.outcome != 'parse error' or self.progress >= MIN_PARSE_PROGRESS
+
+# Records the deepest nesting reached during one parse
+class _DepthTrackingAnalyzer(SyntaxAnalyzer):
+    max_depth = 0
+
+    def _enter(self) -> None:
+        # recorded first, so a level rejected by the nesting limit still counts
+        self.max_depth = max(self.max_depth, self.depth + 1)
+        super()._enter()
+
+class Fuzzer:
+    def __init__(self, size: int = DEFAULT_SIZE, seed: Optional[int] = None, repeats: int = 3):
+        base = _here()
+        self.lexer = LexicalAnalyzer(
+            keyword_path=str(base / 'keywords.txt'),
+            builtin_path=str(base / 'builtin.txt'),
+            token_lexeme_path=str(base / 'token_lexeme.txt'),
+            token_translation_path=str(base / 'token_translation.txt'),
+        )
+        self.parser = SerpentParser(block_termination_path=str(base / 'block_termination.txt'))
+        self.keywords = self.lexer._load_lines(self.lexer.keyword_path)
+        self.builtins = self.lexer._load_lines(self.lexer.builtin_path)
+        self.size = size
+        self.repeats = repeats
+        self.random = random.Random(seed)
+
+    # ---Measuring---
+    # parser mode repeats whole lines, so no statement is cut in half;
+    # lexer mode repeats the seed back to back, so its lines grow longer
+    @staticmethod
+    def amplify(seed: str, size: int, mode: str = 'parser') -> str:
+        if not seed:
+            return ''
+        if mode == 'parser' and not seed.endswith('\n'):
+            seed += '\n'
+        return seed * max(1, size // len(seed))
+
+    # deadline_seconds=None measures without any budget
+    def measure(self, text: str, mode: str = 'parser', deadline_seconds: Optional[float] = FUZZ_DEADLINE_SECONDS) -> Measurement:
+        best: Optional[Measurement] = None
+        for _ in range(self.repeats):
+            budget = AnalysisBudget(deadline_seconds=deadline_seconds) if deadline_seconds is not None else None
+            syn: Optional[_DepthTrackingAnalyzer] = None
+            outcome = 'ok'
+            start = time.perf_counter()
+            try:
+                tokens, errors = self.lexer.tokenize(text, budget)
+                if errors:
+                    outcome = 'lex errors'
+                if mode == 'parser':
+                    syn = _DepthTrackingAnalyzer(tokens, budget=budget, block_endings=self.parser.block_endings)
+                    syn.parse_program()
+            except ParseError:
+                outcome = 'nesting' if syn is not None and syn.max_depth > MAX_NESTING else 'parse error'
+            except BudgetExceeded:
+                outcome = 'budget'
+            except RecursionError:
+                outcome = 'recursion'
+            seconds = time.perf_counter() - start
+            depth = syn.max_depth if syn is not None else 0
+            progress = syn.i / max(1, len(syn.tokens)) if syn is not None else 1.0
+            if best is None or seconds < best.seconds:
+                best = Measurement(seconds, depth, outcome, progress)
+        return best
+
+    # seconds per byte of the seed amplified to self.size; 0 for a parser-mode
+    # seed whose parse stops early, since then only the lexer was measured
+    def cost(self, seed: str, mode: str) -> Tuple[float, Measurement]:
+        text = self.amplify(seed, self.size, mode)
+        result = self.measure(text, mode)
+        if mode == 'parser' and not result.parsed_enough:
+            return 0.0, result
+        return result.seconds / max(1, len(text)), result
+
+    # the higher scoring of the two modes
+    def best_cost(self, seed: str) -> Tuple[float, Measurement, str]:
+        scored = [(*self.cost(seed, mode), mode) for mode in MODES]
+        return max(scored, key=lambda s: s[0])
+
+    def growth_ratio(self, seed: str, mode: str, deadline_seconds: Optional[float] = FUZZ_DEADLINE_SECONDS) -> float:
+        small = self.measure(self.amplify(seed, self.size, mode), mode, deadline_seconds).seconds
+        large = self.measure(self.amplify(seed, 4 * self.size, mode), mode, deadline_seconds).seconds
+        return large / max(small, 1e-6)
+
+    # ---Generating (follows the grammar in SyntaxAnalyzer)---
+    def _ident(self) -> str:
+        return self.random.choice(['x', 'y', 'total', 'n', '_t', 'iff', 'fors'])
+
+    def gen_expr(self, depth: int = 0) -> str:
+        choice = self.random.randrange(8 if depth < 6 else 3)
+        if choice == 0:
+            return str(self.random.randrange(100))
+        if choice == 1:
+            return self._ident()
+        if choice == 2:
+            return self.random.choice(["'text'", '"a\\"b"', "f'{x}'"])
+        if choice == 3:
+            return f'({self.gen_expr(depth + 1)})'
+        if choice == 4:
+            items = ', '.join(self.gen_expr(depth + 1) for _ in range(self.random.randrange(4)))
+            return f'[{items}]'
+        if choice == 5:
+            return f'{self.random.choice(self.builtins)}({self.gen_expr(depth + 1)})'
+        if choice == 6:
+            return f'{self.gen_expr(depth + 1)} if {self.gen_expr(depth + 1)} else {self.gen_expr(depth + 1)}'
+        op = self.random.choice(['+', '-', '*', '/', '==', '!=', '<', '>=', '<=', '>'])
+        return f'{self.gen_expr(depth + 1)} {op} {self.gen_expr(depth + 1)}'
+
+    def gen_stmt(self, depth: int = 0) -> str:
+        indent = '    ' * depth
+        choice = self.random.randrange(4 if depth < 3 else 2)
+        if choice == 0:
+            op = self.random.choice(['=', '=', '+=', '-=', '*=', '/='])
+            return f'{indent}{self._ident()} {op} {self.gen_expr()}\n'
+        if choice == 1:
+            return f'{indent}print({self.gen_expr()})\n'
+        body = ''.join(self.gen_stmt(depth + 1) for _ in range(1 + self.random.randrange(3)))
+        if choice == 2:
+            return f'{indent}for {self._ident()} in {self.gen_expr()}:\n{body}{indent}endfor\n'
+        text = f'{indent}if {self.gen_expr()}:\n{body}'
+        if self.random.random() < 0.5:
+            text += f'{indent}else:\n' + ''.join(self.gen_stmt(depth + 1) for _ in range(1 + self.random.randrange(2)))
+        return text + f'{indent}endif\n'
+
+    def gen_program(self) -> str:
+        return ''.join(self.gen_stmt() for _ in range(1 + self.random.randrange(4)))
+
+    # ---Mutating---
+    def _piece(self) -> str:
+        pool = self.random.choice([SYMBOLS, FRAGMENTS, self.keywords, self.builtins])
+        return self.random.choice(pool)
+
+    def mutate(self, seed: str) -> str:
+        if not seed:
+            return self._piece()
+        pos = self.random.randrange(len(seed) + 1)
+        end = min(len(seed), pos + self.random.randrange(1, 16))
+        choice = self.random.randrange(7)
+        if choice == 0:  # insert a token or fragment
+            return seed[:pos] + self._piece() + seed[pos:]
+        if choice == 1:  # delete a slice
+            return seed[:pos] + seed[end:]
+        if choice == 2:  # repeat a slice, to grow chains of the same construct
+            return seed[:pos] + seed[pos:end] * self.random.randrange(2, 8) + seed[end:]
+        if choice == 3:  # wrap a slice in parentheses or brackets
+            left, right = self.random.choice([('(', ')'), ('[', ']'), ('-', ''), ("'", '')])
+            return seed[:pos] + left + seed[pos:end] + right + seed[end:]
+        if choice == 4:  # replace a slice with a generated expression
+            return seed[:pos] + self.gen_expr() + seed[end:]
+        if choice == 5:  # splice in a generated statement
+            return seed[:pos] + self.gen_stmt() + seed[pos:]
+        return seed[:pos] + self._piece() + seed[end:]
+
+    # ---Minimizing---
+    # Removes slices (halves, then quarters, ... then single characters) while the
+    # amplified seed stays at least `keep` times as slow per byte and as deep as the
+    # original, and ends the same way (so a slow parse is not traded for a fast lex error)
+    def _still_interesting(self, candidate: str, mode: str, target: float, original: Measurement, keep: float) -> bool:
+        per_byte, result = self.cost(candidate, mode)
+        return (per_byte >= keep * target and result.outcome == original.outcome
+                and result.depth >= keep * original.depth)
+
+    def minimize(self, seed: str, mode: str, keep: float = 0.8, max_attempts: int = 400) -> str:
+        target, original = self.cost(seed, mode)
+        chunk = max(1, len(seed) // 2)
+        attempts = 0
+        while chunk >= 1 and attempts < max_attempts:
+            pos = 0
+            while pos < len(seed) and attempts < max_attempts:
+                candidate = seed[:pos] + seed[pos + chunk:]
+                attempts += 1
+                if candidate and self._still_interesting(candidate, mode, target, original, keep):
+                    seed = candidate
+                else:
+                    pos += chunk
+            chunk //= 2
+        return seed
+
+    # ---Search---
+    # Keeps a population of the slowest and the deepest seeds and mutates them.
+    # Returns (seconds per byte, depth, seed, mode), slowest first.
+    def run(self, iterations: int, population: int = 16, report_every: int = 100) -> List[Tuple[float, int, str, str]]:
+        scored: List[Tuple[float, int, str, str]] = []
+        for _ in range(population):
+            seed = self.gen_program()
+            per_byte, result, mode = self.best_cost(seed)
+            scored.append((per_byte, result.depth, seed, mode))
+
+        for iteration in range(1, iterations + 1):
+            parent = self.random.choice(scored)[2]
+            child = self.mutate(parent)
+            if len(child) > self.size:
+                child = child[:self.size]
+            per_byte, result, mode = self.best_cost(child)
+            scored.append((per_byte, result.depth, child, mode))
+
+            slowest = sorted(scored, key=lambda s: s[0], reverse=True)[:population]
+            deepest = sorted(scored, key=lambda s: s[1], reverse=True)[:population // 4]
+            scored = slowest + [s for s in deepest if s not in slowest]
+
+            if report_every and iteration % report_every == 0:
+                top = slowest[0]
+                print(f'[{iteration}] slowest {top[0] * 1e9:.0f} ns/byte ({top[3]}), deepest {max(s[1] for s in scored)}')
+
+        return sorted(scored, key=lambda s: s[0], reverse=True)
+
+
+# ---Corpus---
+# corpus.txt lines: file|mode|size|max_seconds
+def load_corpus(corpus_dir: Path) -> List[Tuple[Path, str, int, float]]:
+    index = corpus_dir / CORPUS_INDEX
+    if not index.exists():
+        return []
+    entries: List[Tuple[Path, str, int, float]] = []
+    for raw in index.read_text(encoding='utf-8').splitlines():
+        line = raw.split('#', 1)[0].strip()
+        if not line:
+            continue
+        name, mode, size, limit = line.split('|')
+        entries.append((corpus_dir / name.strip(), mode.strip(), int(size), float(limit)))
+    return entries
+
+def worth_saving(fuzzer: Fuzzer, seed: str, mode: str) -> bool:
+    result = fuzzer.measure(fuzzer.amplify(seed, fuzzer.size, mode), mode)
+    return result.depth >= SAVE_MIN_DEPTH or fuzzer.growth_ratio(seed, mode) >= SAVE_MIN_GROWTH
+
+def save_case(fuzzer: Fuzzer, corpus_dir: Path, seed: str, mode: str) -> Tuple[str, float]:
+    corpus_dir.mkdir(exist_ok=True)
+    # named after the amplified text, so seeds that only differ in a trailing newline
+    # (which parser mode adds anyway) are saved once
+    amplified = fuzzer.amplify(seed, fuzzer.size, mode)
+    name = hashlib.sha1(f'{mode}|{amplified}'.encode('utf-8')).hexdigest()[:12] + '.sp'
+    (corpus_dir / name).write_text(seed, encoding='utf-8', newline='')
+    seconds = fuzzer.measure(amplified, mode, deadline_seconds=None).seconds
+    limit = max(MIN_LIMIT_SECONDS, LIMIT_FACTOR * seconds)
+
+    known = {path.name for path, _, _, _ in load_corpus(corpus_dir)}
+    if name not in known:
+        index = corpus_dir / CORPUS_INDEX
+        if not index.exists():
+            index.write_text('# Slowest inputs found by fuzz_analysis.py\n# file|mode|size|max_seconds\n', encoding='utf-8')
+        with index.open('a', encoding='utf-8') as f:
+            f.write(f'{name}|{mode}|{fuzzer.size}|{limit:.3f}\n')
+    return name, limit
+
+# Measures one saved seed without a budget, the way SerpentParser.parse is called by
+# default. Returns the measurement at `size` and the growth ratio from there.
+def replay_case(path: Path, mode: str, size: int, repeats: int = 3) -> Tuple[Measurement, float]:
+    fuzzer = Fuzzer(size=size, repeats=repeats)
+    seed = path.read_text(encoding='utf-8')
+    result = fuzzer.measure(fuzzer.amplify(seed, size, mode), mode, deadline_seconds=None)
+    return result, fuzzer.growth_ratio(seed, mode, deadline_seconds=None)
+
+# Replays every saved seed; fails if one grows superlinearly, overflows the stack or,
+# with use_limits, is over the time limit measured on the machine that saved it.
+# scale multiplies the saved sizes, so fast seeds take long enough to time reliably.
+def check_corpus(corpus_dir: Path, use_limits: bool = True, scale: int = 1) -> bool:
+    entries = load_corpus(corpus_dir)
+    if not entries:
+        print(f'No corpus in {corpus_dir}')
+        return True
+    ok = True
+    for path, mode, size, limit in entries:
+        result, ratio = replay_case(path, mode, size * scale)
+        passed = ratio <= MAX_GROWTH_RATIO and result.outcome != 'recursion'
+        if use_limits:
+            passed = passed and result.seconds <= limit * scale
+        ok = ok and passed
+        status = 'ok' if passed else 'FAIL'
+        print(f'{status:4} {path.name} ({mode}): {result.seconds:.4f}s (limit {limit * scale:.3f}s), growth x{ratio:.1f}, '
+              f'depth {result.depth}, parsed {result.progress:.0%}, {result.outcome}')
+    return ok
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = argparse.ArgumentParser(description='Worst-case performance fuzzer for the Serpent+ lexer and parser')
+    commands = arguments.add_subparsers(dest='command', required=True)
+
+    fuzz = commands.add_parser('fuzz', help='search for slow inputs')
+    fuzz.add_argument('--iterations', type=int, default=1000)
+    fuzz.add_argument('--size', type=int, default=DEFAULT_SIZE, help='bytes each seed is amplified to')
+    fuzz.add_argument('--seed', type=int, default=None, help='random seed, for reproducible runs')
+    fuzz.add_argument('--save', type=int, default=0, help='minimize and save this many of the slowest seeds')
+
+    check = commands.add_parser('check', help='replay the saved corpus against its time limits')
+    for command in (fuzz, check):
+        command.add_argument('--corpus', default=str(_here() / 'fuzz_corpus'))
+
+    args = arguments.parse_args(argv)
+    corpus_dir = Path(args.corpus)
+
+    if args.command == 'check':
+        return 0 if check_corpus(corpus_dir) else 1
+
+    fuzzer = Fuzzer(size=args.size, seed=args.seed)
+    ranked = fuzzer.run(args.iterations)
+    for per_byte, depth, seed, mode in ranked[:5]:
+        print(f'{per_byte * 1e9:8.0f} ns/byte  {mode:6}  depth {depth:3}  '
+              f'growth x{fuzzer.growth_ratio(seed, mode):.1f}  {seed[:60]!r}')
+
+    saved = set()
+    for per_byte, _, seed, mode in ranked[:args.save]:
+        if per_byte <= 0:
+            continue
+        small = fuzzer.minimize(seed, mode)
+        if not small or (small, mode) in saved:
+            continue
+        saved.add((small, mode))
+        if not worth_saving(fuzzer, small, mode):
+            print(f'skipped {small[:60]!r} ({mode}): linear and shallow')
+            continue
+        name, limit = save_case(fuzzer, corpus_dir, small, mode)
+        print(f'saved {name} ({mode}, {len(small)} bytes, limit {limit:.3f}s): {small[:60]!r}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
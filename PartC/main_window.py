@@ -1,16 +1,17 @@
 from __future__ import annotations
 
+import mmap
 import sys
 
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Dict, Optional
 from pathlib import Path
 
-from PySide6.QtCore import Qt, QSize, QRectF
+from PySide6.QtCore import Qt, QSize, QRectF, QThread, Signal
 from PySide6.QtGui import QIcon, QPixmap, QFont, QFontDatabase, QPainter, QTextCursor, QTextCharFormat, QColor
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QPushButton,
     QTextEdit, QLineEdit, QLabel, QFileDialog, QMessageBox, QPlainTextEdit, QSplitter,
-    QTableWidget, QSizePolicy, QTableWidgetItem, QHeaderView,
+    QTableWidget, QSizePolicy, QTableWidgetItem, QHeaderView, QProgressBar,
 )
 
 # SVG Renderer
@@ -21,8 +22,10 @@ except (ImportError, ModuleNotFoundError):
     QSvgRenderer = None  # type: ignore[assignment]
     _SVG_AVAILABLE = False
 
-from LexicalAnalyzer import LexicalAnalyzer, Token, TokenRow
-from SyntaxAnalyzer import SyntaxAnalyzer, ParseError
+from LexicalAnalyzer import LexicalAnalyzer, Token, TokenRow, split_source
+from SyntaxAnalyzer import SerpentParser, ParseError
+from SymbolIndex import SymbolIndex, Location
+from AnalysisBudget import AnalysisBudget, BudgetExceeded
 
 DEFAULT_SAMPLE = '''\
 list = [1, 2, 3]
@@ -43,12 +46,53 @@ endif
 '''
 
 TABLE_LABELS = ['Lexeme', 'Token', 'Explanation']
+SYMBOL_TABLE_LABELS = ['Identifier', 'Defined', 'Used']
+SYMBOL_USES_SHOWN = 5  # lines listed in the 'Used' cell; clicking it steps through all of them
+
+# Limits for one press of Analyze, so a pathological input cannot hang the window
+ANALYSIS_DEADLINE_SECONDS = 30.0
 
 # to make file-relative paths
 def _here() -> Path:  # returns a pathlib.path
     base = getattr(sys, '_MEIPASS', None)
     return Path(base) if base else Path(__file__).parent.resolve()
 
+# Decodes and lexes an opened file off the GUI thread, one line-aligned chunk
+# (see split_source) at a time; the window only has to insert each chunk's text.
+class FileLoader(QThread):
+    chunk_loaded = Signal(str, int)  # text, percent of the file read so far
+    loaded = Signal(object, object)  # tokens, lexical errors
+    failed = Signal(str)
+
+    def __init__(self, path: str, lexer: LexicalAnalyzer, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.lexer = lexer
+
+    def run(self) -> None:
+        tokens: List[Token] = []
+        errors: List[str] = []
+        try:
+            with open(self.path, 'rb') as file:
+                size = Path(self.path).stat().st_size
+                # mmap cannot map an empty file
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+                try:
+                    for text, end in split_source(data):
+                        if self.isInterruptionRequested():
+                            return
+                        chunk_tokens, chunk_errors = self.lexer.tokenize(text)
+                        tokens.extend(chunk_tokens)
+                        errors.extend(chunk_errors)
+                        self.chunk_loaded.emit(text, int(100 * end / size))
+                finally:
+                    if size:
+                        data.close()
+        except OSError as e:
+            self.failed.emit(f'Failed to open {self.path}.\n\n{e}')
+            return
+        self.loaded.emit(tokens, errors)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -88,10 +132,11 @@ class MainWindow(QMainWindow):
         header_layout.addStretch(1)
 
         # Editor / Code Text Box
-        self.edit_code = QTextEdit()
+        # QPlainTextEdit lays out text block by block, so very large files stay usable
+        self.edit_code = QPlainTextEdit()
         self.edit_code.setPlaceholderText('Type Serpent+ code here...')
         self.edit_code.setPlainText(DEFAULT_SAMPLE)
-        self.edit_code.setLineWrapMode(QTextEdit.NoWrap)
+        self.edit_code.setLineWrapMode(QPlainTextEdit.NoWrap)
         self._apply_code_font(self.edit_code, _here() / 'NanumGothicCoding-Regular.ttf')
 
         # Analyze and Reset Buttons
@@ -112,6 +157,20 @@ class MainWindow(QMainWindow):
                 font-size: 16px;
             }
         ''')
+        self.open_button = QPushButton('Open')
+        self.open_button.setMinimumHeight(50)
+        self.open_button.setStyleSheet('''
+            QPushButton {
+                font-size: 16px;
+            }
+        ''')
+        self.save_button = QPushButton('Save')
+        self.save_button.setMinimumHeight(50)
+        self.save_button.setStyleSheet('''
+            QPushButton {
+                font-size: 16px;
+            }
+        ''')
 
         self.docs_link = QLabel('<a href="https://github.com/michellealzola/CMP3020_Assignment01_Group03/blob/master/PartC/serpent_language_documentation.md">Serpent+ Language Documentation</a>')
         self.docs_link.setStyleSheet('''
@@ -126,6 +185,8 @@ class MainWindow(QMainWindow):
 
         button_box.addWidget(self.analyze_button)
         button_box.addWidget(self.reset_button)
+        button_box.addWidget(self.open_button)
+        button_box.addWidget(self.save_button)
         button_box.addStretch()
         button_box.addWidget(self.docs_link)
 
@@ -149,8 +210,21 @@ class MainWindow(QMainWindow):
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
 
+        # Symbol Table: where each identifier is assigned and read, click a row to jump to it
+        symbol_label = QLabel('Symbol Table')
+        self.symbol_table = QTableWidget(0, 3)
+        self.symbol_table.setHorizontalHeaderLabels(SYMBOL_TABLE_LABELS)
+        self.symbol_table.setSelectionBehavior(QTableWidget.SelectItems)
+        self.symbol_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.symbol_table.verticalHeader().setVisible(False)
+        self.symbol_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.symbols = SymbolIndex()
+        self._next_use: Dict[str, int] = {}
+
         right_panel_layout.addWidget(table_label)
-        right_panel_layout.addWidget(self.table, 1)
+        right_panel_layout.addWidget(self.table, 2)
+        right_panel_layout.addWidget(symbol_label)
+        right_panel_layout.addWidget(self.symbol_table, 1)
 
         # To have a resize handle between the left and right panels
         split = QSplitter(Qt.Horizontal)
@@ -163,10 +237,28 @@ class MainWindow(QMainWindow):
         # Status box
         self.status_label = QLabel('')
         self.statusBar().addWidget(self.status_label)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        self.statusBar().addPermanentWidget(self.progress_bar)
+
+        # Background loading of an opened file (see on_open)
+        self._loader: Optional[FileLoader] = None
+        # tokens lexed while the file was loading, reused by Analyze until the text is edited
+        self._loaded_tokens: Optional[Tuple[List[Token], List[str]]] = None
+        # the lexer and parser are built once and reused
+        self._lexer: Optional[LexicalAnalyzer] = None
+        # block_termination.txt is read once, on the first Analyze
+        self._parser: Optional[SerpentParser] = None
 
         # Button clicked connections
         self.analyze_button.clicked.connect(self.on_analyze)
         self.reset_button.clicked.connect(self.on_reset)
+        self.symbol_table.cellClicked.connect(self.on_symbol_clicked)
+        self.open_button.clicked.connect(self.on_open)
+        self.save_button.clicked.connect(self.on_save)
+        self.edit_code.document().modificationChanged.connect(self._on_modification_changed)
 
     def apply_window_icon(self, primary_svg: Path, fallback_svg: Optional[Path] = None) -> None:
         sizes = [16, 24, 32, 48, 64, 128, 256]
@@ -215,18 +307,18 @@ class MainWindow(QMainWindow):
             font = QFont('Courier New', 12)
         widget.setFont(font)
 
-    def on_analyze(self) -> None:
-        src = self.edit_code.toPlainText()
-
-        # Lexical Analysis
+    def _make_lexer(self) -> Optional[LexicalAnalyzer]:
+        if self._lexer is not None:
+            return self._lexer
         base = _here()
         try:
-            lexer = LexicalAnalyzer(
+            self._lexer = LexicalAnalyzer(
                 keyword_path=str(base / 'keywords.txt'),
                 builtin_path=str(base / 'builtin.txt'),
                 token_lexeme_path=str(base / 'token_lexeme.txt'),
                 token_translation_path=str(base / 'token_translation.txt'),
             )
+            return self._lexer
         except Exception as e:
             self._show_error(
                 'Failed to initialize LexicalAnalyzer.\n'
@@ -234,10 +326,26 @@ class MainWindow(QMainWindow):
                 'keywords.txt, and builtin.txt are present.\n\n'
                 f'{e}'
             )
+            return None
+
+    def on_analyze(self) -> None:
+        # Lexical Analysis
+        base = _here()
+        lexer = self._make_lexer()
+        if lexer is None:
             return
+        budget = AnalysisBudget(deadline_seconds=ANALYSIS_DEADLINE_SECONDS)
 
         try:
-            tokens, lex_errors = lexer.tokenize(src)
+            if self._loaded_tokens is not None:
+                tokens, lex_errors = self._loaded_tokens
+            else:
+                tokens, lex_errors = lexer.tokenize(self.edit_code.toPlainText(), budget)
+        except BudgetExceeded as e:
+            self._populate_table(lexer.tokens_table(e.tokens))
+            self._clear_syntax_results()
+            self._set_status(f'Lexical analysis stopped: {e}', ok=False)
+            return
         except Exception as e:
             self._show_error(
                 'Failed to tokenize source code.\n\n'
@@ -257,24 +365,131 @@ class MainWindow(QMainWindow):
 
         # Syntax Analysis
         try:
-            syn = SyntaxAnalyzer(
-                tokens,
-                block_termination_path=str(base / 'block_termination.txt'),
-            )
-            syn.parse_program()
-            self._set_status('Syntax analysis complete.', ok=True)
+            if self._parser is None:
+                self._parser = SerpentParser(block_termination_path=str(base / 'block_termination.txt'))
+            symbols = self._parser.parse(tokens, budget=budget)
+            self._populate_symbol_table(symbols)
+            warnings = symbols.diagnostics()
+            if warnings:
+                self._set_status(f'Syntax analysis complete. Warning: {warnings[0]}', ok=True)
+            else:
+                self._set_status('Syntax analysis complete.', ok=True)
             self.edit_code.setExtraSelections([])
         except ParseError as e:
+            self._populate_symbol_table(e.symbols or SymbolIndex())
             self._set_status(f'Syntax errors detected: {e}', ok=False)
             self._highlight_error_line(getattr(e, 'line', 1))
             QMessageBox.critical(self, 'Syntax Error', str(e))
+        except BudgetExceeded as e:
+            self._clear_syntax_results()
+            self._set_status(f'Syntax analysis stopped: {e}', ok=False)
+
+    # symbols and error highlights from an earlier run would not match the current text
+    def _clear_syntax_results(self) -> None:
+        self._populate_symbol_table(SymbolIndex())
+        self.edit_code.setExtraSelections([])
 
     def on_reset(self) -> None:
+        self._stop_loading()
+        self._loaded_tokens = None
         self.edit_code.clear()
         self.table.setRowCount(0)
+        self._populate_symbol_table(SymbolIndex())
         self.status_label.setText('')
         self.statusBar().showMessage('')
 
+    # ---Open / Save---
+    # A FileLoader thread decodes and lexes the file chunk by chunk; each chunk is appended
+    # to the editor as it arrives, so by the time the file is fully loaded its tokens are
+    # ready for Analyze.
+    def on_open(self) -> None:
+        path, _ = QFileDialog.getOpenFileName(self, 'Open Serpent+ File', '', 'Serpent+ Files (*.sp *.txt);;All Files (*)')
+        if not path:
+            return
+
+        self._stop_loading()
+        lexer = self._make_lexer()
+        if lexer is None:
+            return
+
+        self._loaded_tokens = None
+        self.edit_code.clear()
+        self.edit_code.setUndoRedoEnabled(False)
+        self.edit_code.setReadOnly(True)
+        self.analyze_button.setEnabled(False)
+        self.table.setRowCount(0)
+        self._populate_symbol_table(SymbolIndex())
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self._set_status(f'Loading {Path(path).name}...', ok=True)
+
+        self._loader = FileLoader(path, lexer, self)
+        self._loader.chunk_loaded.connect(self._on_chunk_loaded)
+        self._loader.loaded.connect(self._on_file_loaded)
+        self._loader.failed.connect(self._on_load_failed)
+        self._loader.start()
+
+    # Signals from a loader that was stopped may still be queued; they are ignored
+    def _from_current_loader(self) -> bool:
+        sender = self.sender()
+        return sender is not None and sender is self._loader
+
+    def _on_chunk_loaded(self, text: str, percent: int) -> None:
+        if not self._from_current_loader():
+            return
+        cursor = self.edit_code.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.progress_bar.setValue(percent)
+
+    def _on_file_loaded(self, tokens: List[Token], errors: List[str]) -> None:
+        if not self._from_current_loader():
+            return
+        self._stop_loading()
+        self.edit_code.document().setModified(False)
+        self._loaded_tokens = (tokens, errors)
+        self.edit_code.moveCursor(QTextCursor.Start)
+        self._set_status(f'File loaded: {self.edit_code.blockCount()} lines, {len(tokens)} tokens.', ok=True)
+
+    def _on_load_failed(self, message: str) -> None:
+        if not self._from_current_loader():
+            return
+        self._stop_loading()
+        self._set_status('', ok=False)
+        self._show_error(message)
+
+    def _stop_loading(self) -> None:
+        if self._loader is not None:
+            self._loader.requestInterruption()
+            self._loader.wait()
+            self._loader = None
+        self.edit_code.setReadOnly(False)
+        self.edit_code.setUndoRedoEnabled(True)
+        self.analyze_button.setEnabled(True)
+        self.progress_bar.setVisible(False)
+
+    # a QThread must not be destroyed while it is still running
+    def closeEvent(self, event) -> None:
+        self._stop_loading()
+        super().closeEvent(event)
+
+    def _on_modification_changed(self, modified: bool) -> None:
+        # tokens lexed during loading no longer match the text once it is edited
+        if modified:
+            self._loaded_tokens = None
+
+    def on_save(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(self, 'Save Serpent+ File', '', 'Serpent+ Files (*.sp *.txt);;All Files (*)')
+        if not path:
+            return
+        try:
+            Path(path).write_text(self.edit_code.toPlainText(), encoding='utf-8')
+        except OSError as e:
+            self._show_error(f'Failed to save {path}.\n\n{e}')
+            return
+        self.edit_code.document().setModified(False)
+        self._set_status(f'Saved {Path(path).name}.', ok=True)
+
     def _make_icon_from_svg(self, svg_path: Path, sizes: List[int]) -> Optional[QIcon]:
         if not (svg_path.exists() and _SVG_AVAILABLE):
             return None
@@ -317,6 +532,57 @@ class MainWindow(QMainWindow):
             self.table.setItem(row, 2, QTableWidgetItem(explanation))
         self.table.resizeColumnsToContents()
 
+    def _populate_symbol_table(self, symbols: SymbolIndex) -> None:
+        self.symbols = symbols
+        self._next_use = {}
+        names = symbols.names()
+        self.symbol_table.setRowCount(len(names))
+        for row, name in enumerate(names):
+            definition = symbols.definition_of(name)
+            uses = symbols.uses_of(name)
+            self.symbol_table.setItem(row, 0, QTableWidgetItem(name))
+            self.symbol_table.setItem(row, 1, QTableWidgetItem(f'line {definition[0]}' if definition else 'never'))
+            self.symbol_table.setItem(row, 2, QTableWidgetItem(self._describe_uses(uses)))
+
+    # A name used thousands of times would make the cell unreadable, so only the first few lines are listed
+    @staticmethod
+    def _describe_uses(uses: List[Location]) -> str:
+        if not uses:
+            return ''
+        lines = ', '.join(str(line) for line, _ in uses[:SYMBOL_USES_SHOWN])
+        more = ', ...' if len(uses) > SYMBOL_USES_SHOWN else ''
+        return f'{len(uses)}: {lines}{more}'
+
+    # Identifier or 'Defined' column jumps to the definition; each click on the 'Used' column
+    # jumps to the next use, wrapping around after the last one
+    def on_symbol_clicked(self, row: int, column: int) -> None:
+        item = self.symbol_table.item(row, 0)
+        if item is None:
+            return
+        name = item.text()
+        uses = self.symbols.uses_of(name)
+        definition = self.symbols.definition_of(name)
+        if uses and (column == 2 or definition is None):
+            index = self._next_use.get(name, 0) % len(uses)
+            self._next_use[name] = index + 1
+            self._jump_to_line(uses[index][0])
+            self.statusBar().showMessage(f'{name}: use {index + 1} of {len(uses)} (line {uses[index][0]})')
+        elif definition is not None:
+            self._jump_to_line(definition[0])
+
+    # Looks the line up directly instead of moving down line by line, which is slow on big files
+    def _cursor_at_line(self, line: int) -> QTextCursor:
+        document = self.edit_code.document()
+        block = document.findBlockByNumber(line - 1)
+        if not block.isValid():
+            block = document.lastBlock()
+        return QTextCursor(block)
+
+    def _jump_to_line(self, line: int) -> None:
+        cursor = self._cursor_at_line(line)
+        self.edit_code.setTextCursor(cursor)
+        self.edit_code.setFocus()
+
     def _set_status(self, text: str, ok: bool = True) -> None:
         self.statusBar().showMessage(text)
         color = '#2e7d32' if ok else '#c62828'
@@ -331,10 +597,7 @@ class MainWindow(QMainWindow):
         frmt.setBackground(QColor('#ffecec'))
         selection.format = frmt
 
-        cursor = self.edit_code.textCursor()
-        cursor.movePosition(QTextCursor.Start)
-        if line > 1:
-            cursor.movePosition(QTextCursor.Down, QTextCursor.MoveAnchor, line - 1)
+        cursor = self._cursor_at_line(line)
         cursor.select(QTextCursor.LineUnderCursor)
         selection.cursor = cursor
 
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the analyzers import each other as top-level modules from PartC/
+PART_C = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(PART_C))
+
+from LexicalAnalyzer import LexicalAnalyzer
+from SyntaxAnalyzer import SerpentParser
+
+@pytest.fixture(scope='session')
+def lexer():
+    return LexicalAnalyzer(
+        keyword_path=str(PART_C / 'keywords.txt'),
+        builtin_path=str(PART_C / 'builtin.txt'),
+        token_lexeme_path=str(PART_C / 'token_lexeme.txt'),
+        token_translation_path=str(PART_C / 'token_translation.txt'),
+    )
+
+@pytest.fixture(scope='session')
+def parser():
+    return SerpentParser(block_termination_path=str(PART_C / 'block_termination.txt'))
+
+# Tokenizes source that is expected to lex without errors
+@pytest.fixture(scope='session')
+def tokens_of(lexer):
+    def tokens_of(source: str):
+        tokens, errors = lexer.tokenize(source)
+        assert not errors
+        return tokens
+    return tokens_of
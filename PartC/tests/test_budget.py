@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from AnalysisBudget import AnalysisBudget, BudgetExceeded, CancellationToken
+
+BLOCK = '''\
+total = 0
+for n in [1, 2, 3]:
+    if n > 1:
+        total += n
+    endif
+endfor
+print(total)
+'''
+
+# about 700k tokens: enough for parse_parallel to use worker processes
+@pytest.fixture(scope='module')
+def big(tokens_of):
+    return tokens_of(BLOCK) * 20000
+
+# Timing asserts compare with the same work done without a budget, instead of
+# fixed limits that depend on the machine: a stopped run has to be much shorter
+def seconds(call) -> float:
+    start = time.monotonic()
+    call()
+    return time.monotonic() - start
+
+@pytest.fixture(scope='module')
+def unbudgeted_seconds(parser, big):
+    return seconds(lambda: parser.parse(big))
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_parallel_stops_at_the_deadline(parser, big, unbudgeted_seconds, workers):
+    start = time.monotonic()
+    with pytest.raises(BudgetExceeded, match='too long'):
+        parser.parse_parallel(big, workers=workers, budget=AnalysisBudget(deadline_seconds=0.01))
+    assert time.monotonic() - start < unbudgeted_seconds / 2
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_parallel_stops_when_cancelled(parser, big, unbudgeted_seconds, workers):
+    cancel = CancellationToken()
+    threading.Timer(0.05, cancel.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(BudgetExceeded, match='cancelled'):
+        parser.parse_parallel(big, workers=workers, budget=AnalysisBudget(cancel_token=cancel))
+    assert time.monotonic() - start < unbudgeted_seconds / 2
+
+def test_parse_parallel_workers_enforce_nesting(parser, tokens_of):
+    tokens = tokens_of(('x = ' + '(' * 40 + '1' + ')' * 40 + '\n') * 20000)
+    with pytest.raises(BudgetExceeded, match='Nesting'):
+        parser.parse_parallel(tokens, workers=2, budget=AnalysisBudget(max_nesting=30))
+
+@pytest.mark.parametrize('statement', [
+    'x = 1' + ' + 1' * 200000,
+    'x = [' + '1, ' * 200000 + '1]',
+])
+def test_parse_stops_at_the_deadline_inside_one_long_statement(parser, tokens_of, statement):
+    tokens = tokens_of(statement + '\n')
+    start = time.monotonic()
+    with pytest.raises(BudgetExceeded, match='too long'):
+        parser.parse(tokens, budget=AnalysisBudget(deadline_seconds=0.01))
+    stopped_after = time.monotonic() - start
+    assert stopped_after < seconds(lambda: parser.parse(tokens)) / 2
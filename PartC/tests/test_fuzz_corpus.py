@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import pytest
+
+from fuzz_analysis import load_corpus, replay_case, MAX_GROWTH_RATIO
+
+# Replays the saved worst cases at twice their saved size, keeping the best of 5 runs, so
+# even the fast ones time reliably while a quadratic regression still fails in about a minute.
+# Only the growth ratio is checked: the absolute limits in corpus.txt were measured on
+# one machine and are for `fuzz_analysis.py check`.
+SCALE = 2
+REPEATS = 5
+# read while collecting, so the cases can be parametrized by file name
+CORPUS_DIR = Path(__file__).parent.parent / 'fuzz_corpus'
+
+@pytest.mark.parametrize('path, mode, size, limit', load_corpus(CORPUS_DIR),
+                         ids=lambda value: value.name if hasattr(value, 'name') else None)
+def test_corpus_case_grows_linearly(path, mode, size, limit):
+    result, ratio = replay_case(path, mode, size * SCALE, REPEATS)
+    assert result.outcome != 'recursion'
+    assert ratio <= MAX_GROWTH_RATIO
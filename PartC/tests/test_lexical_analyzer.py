@@ -0,0 +1,43 @@
+import pytest
+
+from LexicalAnalyzer import split_source, SOURCE_CHUNK_BYTES
+
+LINES = [
+    'total = 0',
+    "name = f'café {total}'",  # non-ASCII text
+    'for n in [1, 2, 3]:\r',  # Windows line ending
+    '    total += n',
+    'endfor',
+]
+
+def lex_in_pieces(lexer, data: bytes, chunk_bytes: int):
+    tokens, errors, texts = [], [], []
+    for text, _ in split_source(data, chunk_bytes):
+        piece_tokens, piece_errors = lexer.tokenize(text)
+        tokens += piece_tokens
+        errors += piece_errors
+        texts.append(text)
+    return tokens, errors, ''.join(texts)
+
+@pytest.mark.parametrize('chunk_bytes', [1, 7, 64, SOURCE_CHUNK_BYTES])
+def test_pieces_lex_like_the_whole_file(lexer, chunk_bytes):
+    # one line is longer than a whole chunk, so it has to come out in one piece
+    long_line = 'x = [' + '1, ' * (SOURCE_CHUNK_BYTES // 3) + '1]'
+    source = '\n'.join(LINES * 50 + [long_line] + LINES * 50) + '\n'
+    data = source.encode('utf-8')
+
+    whole = source.replace('\r\n', '\n')
+    tokens, errors, text = lex_in_pieces(lexer, data, chunk_bytes)
+    assert text == whole
+    assert (tokens, errors) == lexer.tokenize(whole)
+    assert not errors
+
+def test_byte_order_mark_is_dropped(lexer):
+    tokens, errors, text = lex_in_pieces(lexer, b'\xef\xbb\xbfx = 1\r\n', chunk_bytes=2)
+    assert text == 'x = 1\n'
+    assert not errors
+
+def test_last_piece_without_a_newline():
+    pieces = list(split_source(b'a = 1\nb = 2', chunk_bytes=4))
+    assert pieces == [('a = 1\n', 6), ('b = 2', 11)]
+    assert list(split_source(b'')) == []
@@ -0,0 +1,126 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from SyntaxAnalyzer import ParseError, split_top_level, PARALLEL_MIN_TOKENS, MAX_NESTING
+
+STATEMENTS = [
+    'total = total + n',
+    'count += 1',
+    'print(count, len(items))',
+    'for n in items:\n    total += n\nendfor',
+    'if total > 3:\n    print(total)\nelse:\n    average = total / count\nendif',
+    'x = (1 +',  # syntax error
+]
+
+def make_documents(lexer, count: int):
+    rng = random.Random(3020)
+    documents = []
+    for _ in range(count):
+        lines = ['items = [1, 2, 3]'] + [rng.choice(STATEMENTS) for _ in range(rng.randrange(5, 200))]
+        tokens, _ = lexer.tokenize('\n'.join(lines) + '\n')
+        documents.append(tokens)
+    return documents
+
+# Everything parse() produces for one document, as plain values
+def outcome(parser, tokens):
+    try:
+        symbols, error = parser.parse(tokens), None
+    except ParseError as e:
+        symbols, error = e.symbols, str(e)
+    return error, symbols.definitions, symbols.uses, symbols.early_uses
+
+def test_parse_error_carries_the_symbols_found_so_far(lexer, parser):
+    tokens, _ = lexer.tokenize('a = 1\nb = a\nc = (\n')
+    with pytest.raises(ParseError) as info:
+        parser.parse(tokens)
+    assert info.value.line == 3
+    assert set(info.value.symbols.definitions) == {'a', 'b'}
+
+def test_block_endings_cannot_be_changed(parser):
+    with pytest.raises(TypeError):
+        parser.block_endings['if'] = 'fi'
+
+def test_shared_parser_gives_the_same_results_in_parallel_threads(lexer, parser):
+    documents = make_documents(lexer, 300)
+    expected = [outcome(parser, tokens) for tokens in documents]
+    assert any(error for error, *_ in expected) and not all(error for error, *_ in expected)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for _ in range(3):
+            assert list(pool.map(lambda tokens: outcome(parser, tokens), documents)) == expected
+
+# The documented limit: the assignment's expression is one level, and every pair of
+# parentheses, unary sign or block adds one
+@pytest.mark.parametrize('make_source', [
+    lambda levels: 'x = ' + '(' * (levels - 1) + '1' + ')' * (levels - 1) + '\n',
+    lambda levels: 'x = ' + '-' * (levels - 1) + '1\n',
+    lambda levels: 'for n in items:\n' * (levels - 1) + 'x = 1\n' + 'endfor\n' * (levels - 1),
+])
+def test_nesting_limit_is_exactly_max_nesting(lexer, parser, make_source):
+    tokens, _ = lexer.tokenize(make_source(MAX_NESTING))
+    parser.parse(tokens)
+    tokens, _ = lexer.tokenize(make_source(MAX_NESTING + 1))
+    with pytest.raises(ParseError, match=f'Nesting deeper than {MAX_NESTING} levels'):
+        parser.parse(tokens)
+
+@pytest.mark.parametrize('source', [
+    'x = ' + '(' * 300 + '1\n',
+    'x = ' + '-' * 1000 + '1\n',
+    'x = ' + '1 if 1 else ' * 300 + '1\n',
+    'for n in [1]:\n' * 300,
+])
+def test_deep_nesting_is_a_parse_error_without_a_budget(lexer, parser, source):
+    tokens, _ = lexer.tokenize(source)
+    with pytest.raises(ParseError, match='Nesting deeper'):
+        parser.parse(tokens)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with pytest.raises(ParseError, match='Nesting deeper'):
+            pool.submit(parser.parse, tokens).result()
+
+def test_deep_nesting_is_reported_by_parse_parallel_workers(lexer, parser):
+    tokens, _ = lexer.tokenize('x = ' + '(' * 300 + '1\n' + 'y = 1\n' * 60000)
+    errors, _ = parser.parse_parallel(tokens, workers=2)
+    assert [(e.line, e.message) for e in errors] == [(1, 'Nesting deeper than 100 levels')]
+
+# ---parse_parallel---
+def symbol_values(symbols):
+    return symbols.definitions, symbols.uses, symbols.early_uses
+
+def test_split_top_level_ignores_conditional_expressions(lexer, parser):
+    tokens, _ = lexer.tokenize('x = 1\nprint(x) if x else print(0)\ny = x if x else 0\nz = y\n')
+    chunks = split_top_level(tokens, parser.block_endings, target=1)
+    assert [first_line for _, _, first_line in chunks] == [1, 2, 3, 4]
+
+def test_blocks_on_a_chunk_boundary_stay_whole(lexer, parser):
+    source = 'total = 0\nfor n in [1, 2]:\n    if n > 1:\n        total += n\n    endif\nendfor\nprint(total)\n' * 3
+    tokens, _ = lexer.tokenize(source)
+    assert [line for _, _, line in split_top_level(tokens, parser.block_endings, target=1)] == \
+        [1, 2, 7, 8, 9, 14, 15, 16, 21]
+    errors, symbols = parser.parse_parallel(tokens, chunk_tokens=1)
+    assert errors == []
+    assert symbol_values(symbols) == symbol_values(parser.parse(tokens))
+
+# about 70k tokens, so workers > 1 really use processes
+BLOCK = 'total = 0\nfor n in items:\n    if n > 1:\n        total += n\n    endif\nendfor\nprint(total, count)\n'
+REPEATS = 2000
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_parse_parallel_symbols_match_parse(lexer, parser, workers):
+    tokens, _ = lexer.tokenize('items = [1, 2, 3]\n' + BLOCK * REPEATS + 'count = 0\n')
+    assert len(tokens) > PARALLEL_MIN_TOKENS
+    errors, symbols = parser.parse_parallel(tokens, workers=workers)
+    assert errors == []
+    assert symbol_values(symbols) == symbol_values(parser.parse(tokens))
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_parse_parallel_reports_errors_with_program_lines(lexer, parser, workers):
+    lines = (BLOCK * REPEATS).splitlines()
+    bad_lines = [1002, 7001, 13000]  # far enough apart to fall in different pieces
+    for line in bad_lines:
+        assert lines[line - 1] == 'total = 0'
+        lines[line - 1] = 'total = (0'
+    tokens, _ = lexer.tokenize('\n'.join(lines) + '\n')
+    errors, _ = parser.parse_parallel(tokens, workers=workers)
+    assert [e.line for e in errors] == bad_lines
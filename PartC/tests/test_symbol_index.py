@@ -0,0 +1,48 @@
+import pytest
+
+SOURCE = '''\
+list = [1, 2, 3]
+sum = 0
+count = total
+
+for n in list:
+    sum += n
+    count += 1
+endfor
+total = sum
+average = sum / count
+print(average, total)
+'''
+
+@pytest.fixture
+def index_of(parser, tokens_of):
+    return lambda source: parser.parse(tokens_of(source))
+
+def edit(source: str, first_line: int, last_line: int, new_lines: str) -> str:
+    lines = source.splitlines(keepends=True)
+    return ''.join(lines[:first_line - 1]) + new_lines + ''.join(lines[last_line:])
+
+def assert_same(updated, expected):
+    assert updated.definitions == expected.definitions
+    assert updated.uses == expected.uses
+    assert updated.early_uses == expected.early_uses
+    assert updated.diagnostics() == expected.diagnostics()
+
+def test_replace_lines_matches_full_parse_when_lines_are_added(index_of):
+    new_lines = 'total = 0\nextra = total + sum\n'
+    index = index_of(SOURCE)
+    index.replace_lines(3, 3, index_of(new_lines), line_delta=1)
+    assert_same(index, index_of(edit(SOURCE, 3, 3, new_lines)))
+
+def test_replace_lines_matches_full_parse_when_a_block_is_removed(index_of):
+    # the replaced range covers whole top-level statements (the for-block on lines 4-8)
+    new_lines = 'n = 1\n'
+    index = index_of(SOURCE)
+    index.replace_lines(4, 8, index_of(new_lines), line_delta=-4)
+    assert_same(index, index_of(edit(SOURCE, 4, 8, new_lines)))
+
+def test_replace_lines_updates_used_before_assigned(index_of):
+    index = index_of(SOURCE)
+    assert index.used_before_assigned('total') == [(3, 2)]
+    index.replace_lines(3, 3, index_of('count = 0\n'), line_delta=0)
+    assert index.used_before_assigned('total') == []